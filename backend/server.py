@@ -1,34 +1,512 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import JSONResponse, PlainTextResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from collections import OrderedDict, Counter
 import os
+import sys
 import logging
+import asyncio
+import contextvars
+import math
+import threading
+import time
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Optional
 import uuid
 from datetime import datetime, timedelta
 import jwt
-from passlib.context import CryptContext
 import base64
+import binascii
+import hashlib
+import io
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
 # MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# The client, database and password context are built on first use so that a
+# cold serverless instance only pays for what the first request needs. They
+# are then kept at module level and reused by every warm invocation.
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '10'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '60000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '20000'))
+WARMUP_ON_STARTUP = os.environ.get('WARMUP_ON_STARTUP', 'true').lower() in ('1', 'true', 'yes')
+
+@lru_cache(maxsize=None)
+def get_client():
+    from motor.motor_asyncio import AsyncIOMotorClient
+    return AsyncIOMotorClient(
+        os.environ['MONGO_URL'],
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        event_listeners=[make_pool_listener(load_monitor), make_profiler_listener(profiler)],
+    )
+
+@lru_cache(maxsize=None)
+def get_db():
+    return get_client()[os.environ['DB_NAME']]
+
+def close_client():
+    if get_client.cache_info().currsize:
+        get_client().close()
+        get_client.cache_clear()
+        get_db.cache_clear()
 
 # Security
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = "your-secret-key-change-in-production"
 
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Rate limiting and load shedding
+# Each authenticated user gets a token bucket and a cap on concurrent requests
+# per route class, so one member cannot starve the others of the shared
+# MongoDB. Limits are "requests per second,burst,concurrent requests".
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+LOOP_LAG_THRESHOLD_MS = float(os.environ.get('LOOP_LAG_THRESHOLD_MS', '250'))
+MONGO_WAIT_QUEUE_THRESHOLD = int(os.environ.get('MONGO_WAIT_QUEUE_THRESHOLD', '20'))
+SHED_RETRY_AFTER_SECONDS = 1
+RATE_LIMIT_EXEMPT_PATHS = ("/api/health/",)
+
+def parse_route_limits(name, default):
+    rate, burst, concurrency = os.environ.get(f'RATE_LIMIT_{name.upper()}', default).split(',')
+    return float(rate), float(burst), int(concurrency)
+
+ROUTE_CLASS_LIMITS = {
+    "search": parse_route_limits("search", "2,10,2"),
+    "documents": parse_route_limits("documents", "5,20,4"),
+    "default": parse_route_limits("default", "10,40,8"),
+}
+
+def get_route_class(path: str) -> str:
+    if path.startswith("/api/search"):
+        return "search"
+    if path.startswith("/api/documents"):
+        return "documents"
+    return "default"
+
+class InMemoryRateLimitBackend:
+    """Token buckets kept in the process; also the local stand-in for the shared backend."""
+
+    max_buckets = 10000
+
+    def __init__(self):
+        # key -> (tokens, last update, time the bucket is full again), least recently used first
+        self.buckets = OrderedDict()
+
+    async def take_token(self, key: str, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        bucket = self.buckets.pop(key, None)
+        if bucket is None:
+            self.evict(now)
+            tokens, last = burst, now
+        else:
+            tokens, last, _ = bucket
+        tokens = min(burst, tokens + (now - last) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self.buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+        return 0.0 if allowed else (1 - tokens) / rate
+
+    def evict(self, now: float):
+        if len(self.buckets) < self.max_buckets:
+            return
+        # A bucket that has refilled completely holds no state
+        for key in [key for key, (_, _, full_at) in self.buckets.items() if full_at <= now]:
+            del self.buckets[key]
+        while len(self.buckets) >= self.max_buckets:
+            self.buckets.popitem(last=False)
+
+class MongoRateLimitBackend:
+    """Token buckets shared by every instance through the rate_limits collection."""
+
+    def __init__(self):
+        self.indexed = False
+
+    async def ensure_ttl_index(self):
+        # A bucket left alone long enough to refill completely holds no state,
+        # so MongoDB may drop it once the slowest class has had time to refill.
+        ttl = max(math.ceil(burst / rate) for rate, burst, _ in ROUTE_CLASS_LIMITS.values())
+        try:
+            await get_db().rate_limits.create_index("last", expireAfterSeconds=ttl)
+        except Exception as e:
+            logger.warning(f"Could not create the rate_limits TTL index: {e}")
+        self.indexed = True
+
+    async def take_token(self, key: str, rate: float, burst: float) -> float:
+        from pymongo import ReturnDocument
+        if not self.indexed:
+            await self.ensure_ttl_index()
+        now = datetime.utcnow()
+        elapsed_seconds = {"$divide": [{"$subtract": [now, {"$ifNull": ["$last", now]}]}, 1000]}
+        refilled = {"$min": [burst, {"$add": [
+            {"$ifNull": ["$tokens", burst]},
+            {"$multiply": [elapsed_seconds, rate]}
+        ]}]}
+        has_token = {"$gte": ["$tokens", 1]}
+        bucket = await get_db().rate_limits.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "last": now}},
+                {"$set": {
+                    "allowed": has_token,
+                    "tokens": {"$cond": [has_token, {"$subtract": ["$tokens", 1]}, "$tokens"]}
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if bucket["allowed"]:
+            return 0.0
+        return (1 - bucket["tokens"]) / rate
+
+class RateLimiter:
+    def __init__(self, backend):
+        self.backend = backend
+        # Concurrency caps always stay per instance: a shared counter would
+        # leak slots whenever an instance is frozen mid-request.
+        self.active = {}
+
+    async def acquire(self, tenant: str, route_class: str) -> float:
+        """Admit a request, or return how many seconds the caller should wait."""
+        rate, burst, concurrency = ROUTE_CLASS_LIMITS[route_class]
+        key = f"{tenant}:{route_class}"
+        if self.active.get(key, 0) >= concurrency:
+            return SHED_RETRY_AFTER_SECONDS
+        # Hold the slot across the backend call, which may await MongoDB,
+        # so parallel requests cannot all pass the check above
+        self.active[key] = self.active.get(key, 0) + 1
+        try:
+            retry_after = await self.backend.take_token(key, rate, burst)
+        except BaseException:
+            self.release(tenant, route_class)
+            raise
+        if retry_after:
+            self.release(tenant, route_class)
+        return retry_after
+
+    def release(self, tenant: str, route_class: str):
+        key = f"{tenant}:{route_class}"
+        remaining = self.active.get(key, 0) - 1
+        if remaining > 0:
+            self.active[key] = remaining
+        else:
+            self.active.pop(key, None)
+
+class LoadMonitor:
+    interval = 0.1
+    # A longer gap is the instance being suspended between invocations, not load.
+    max_lag_sample = 5.0
+    smoothing = 0.2
+
+    def __init__(self):
+        self.loop_lag = 0.0
+        # Updated from motor's executor threads
+        self.mongo_waiting = 0
+        self.mongo_waiting_lock = threading.Lock()
+        self._task = None
+
+    def add_mongo_waiting(self, delta: int):
+        with self.mongo_waiting_lock:
+            self.mongo_waiting += delta
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._watch_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _watch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - started - self.interval
+            if lag < self.max_lag_sample:
+                # Smoothed so that a single slow call does not shed the next requests
+                self.loop_lag += (lag - self.loop_lag) * self.smoothing
+
+    def overloaded(self) -> bool:
+        return (
+            self.loop_lag * 1000 > LOOP_LAG_THRESHOLD_MS
+            or self.mongo_waiting > MONGO_WAIT_QUEUE_THRESHOLD
+        )
+
+def make_pool_listener(monitor: LoadMonitor):
+    from pymongo.monitoring import ConnectionPoolListener
+
+    class PoolWaitListener(ConnectionPoolListener):
+        # Requests waiting for a pooled connection: check-outs started but
+        # not yet served or failed.
+        def connection_check_out_started(self, event):
+            monitor.add_mongo_waiting(1)
+
+        def connection_checked_out(self, event):
+            monitor.add_mongo_waiting(-1)
+
+        def connection_check_out_failed(self, event):
+            monitor.add_mongo_waiting(-1)
+
+        def pool_created(self, event): pass
+        def pool_ready(self, event): pass
+        def pool_cleared(self, event): pass
+        def pool_closed(self, event): pass
+        def connection_created(self, event): pass
+        def connection_ready(self, event): pass
+        def connection_closed(self, event): pass
+        def connection_checked_in(self, event): pass
+
+    return PoolWaitListener()
+
+load_monitor = LoadMonitor()
+rate_limiter = RateLimiter(MongoRateLimitBackend() if RATE_LIMIT_BACKEND == 'mongo' else InMemoryRateLimitBackend())
+
+def get_tenant(request) -> str:
+    # Decoding the token is enough to key the limits; the route dependencies
+    # still do the full authentication against the database.
+    credentials = request.headers.get("authorization", "")
+    if credentials.lower().startswith("bearer "):
+        try:
+            payload = jwt.decode(credentials[7:], SECRET_KEY, algorithms=["HS256"])
+            if payload.get("sub"):
+                return f"user:{payload['sub']}"
+        except jwt.PyJWTError:
+            pass
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+def too_many_requests(detail: str, retry_after: float):
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": detail},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+# Profiling
+# An admin opens a capture, shared through the profile_captures collection so
+# every instance sees it. While a request matching the capture is in flight, a
+# thread samples the stacks doing work for it: its task when it runs on the
+# event loop, and motor's executor threads while they hold a connection for it.
+# Each request is written to profile_samples with its time per category and
+# its folded stacks (the flamegraph.pl / speedscope input format).
+PROFILER_INTERVAL_MS = float(os.environ.get('PROFILER_INTERVAL_MS', '10'))
+PROFILER_POLL_SECONDS = float(os.environ.get('PROFILER_POLL_SECONDS', '2'))
+PROFILER_EXEMPT_PATHS = ("/api/health/", "/api/admin/profiler")
+PROFILER_BLOCKING_MODULES = ("passlib", "bcrypt")
+# waiting: in flight but neither running nor talking to Mongo, e.g. queued
+# behind other requests on the event loop
+PROFILER_CATEGORIES = ("event_loop", "blocking", "mongo", "waiting")
+INSTANCE_ID = str(uuid.uuid4())
+
+# Trace of the captured request being served, copied by motor into the
+# executor threads that run its queries
+profiled_request = contextvars.ContextVar("profiled_request", default=None)
+
+def classify_sample(is_loop_thread: bool, stack) -> Optional[str]:
+    """Tell what a thread was doing from its stack, or None if it is not of interest."""
+    if is_loop_thread:
+        top = stack[-1]
+        if top.co_name in ("select", "poll", "control") and top.co_filename.endswith("selectors.py"):
+            return "idle"
+        if any(module in code.co_filename for code in stack for module in PROFILER_BLOCKING_MODULES):
+            return "blocking"
+        return "event_loop"
+    # Motor runs pymongo in executor threads; the periodic executors are its
+    # background monitors and would show up in every sample.
+    filenames = [code.co_filename for code in stack]
+    if any("pymongo" in f for f in filenames) and not any("periodic_executor" in f for f in filenames):
+        return "mongo"
+    return None
+
+def fold_stack(category: str, stack) -> str:
+    return ";".join([f"[{category}]"] + [f"{os.path.basename(code.co_filename)}:{code.co_name}" for code in stack])
+
+def thread_stack(frame) -> list:
+    stack = []
+    while frame is not None:
+        stack.append(frame.f_code)
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+class Profiler:
+    def __init__(self):
+        self.capture = None
+        self.checked_at = 0.0
+        self.refreshing = None
+        self.lock = threading.Lock()
+        self.thread = None
+        self.loop = None
+        self.loop_thread_id = None
+        self.tasks = {}  # asyncio task -> trace of the captured request it serves
+        self.mongo_threads = {}  # executor thread id -> trace it queries for
+
+    async def refresh(self):
+        self.checked_at = time.monotonic()
+        try:
+            self.capture = await get_db().profile_captures.find_one(
+                {"status": "running", "ends_at": {"$gt": datetime.utcnow()}},
+                {"_id": 0}
+            )
+        except Exception as e:
+            logger.warning(f"Could not check for profile captures: {e}")
+            self.capture = None
+
+    async def admit(self, path: str) -> Optional[str]:
+        """Return the capture a request belongs to, counting it against the capture's limit."""
+        # Polled in the background so requests never wait on it
+        if time.monotonic() - self.checked_at >= PROFILER_POLL_SECONDS and (self.refreshing is None or self.refreshing.done()):
+            self.checked_at = time.monotonic()
+            self.refreshing = asyncio.get_running_loop().create_task(self.refresh())
+        capture = self.capture
+        if not capture or capture["ends_at"] <= datetime.utcnow():
+            return None
+        if capture["route"] and not path.startswith(capture["route"]):
+            return None
+
+        db = get_db()
+        query = {"id": capture["id"], "status": "running"}
+        if capture["max_requests"]:
+            query["requests"] = {"$lt": capture["max_requests"]}
+        if not await db.profile_captures.find_one_and_update(query, {"$inc": {"requests": 1}}):
+            await db.profile_captures.update_one({"id": capture["id"]}, {"$set": {"status": "done"}})
+            self.capture = None
+            return None
+        return capture["id"]
+
+    def start_sampling(self, trace: dict):
+        with self.lock:
+            self.tasks[asyncio.current_task()] = trace
+            self.loop = asyncio.get_running_loop()
+            self.loop_thread_id = threading.get_ident()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+                self.thread.start()
+
+    def enter_mongo(self):
+        trace = profiled_request.get()
+        if trace is not None:
+            self.mongo_threads[threading.get_ident()] = trace
+
+    def leave_mongo(self):
+        self.mongo_threads.pop(threading.get_ident(), None)
+
+    def _sample_loop(self):
+        interval = PROFILER_INTERVAL_MS / 1000
+        while True:
+            time.sleep(interval)
+            frames = sys._current_frames()
+            with self.lock:
+                if not self.tasks:
+                    self.thread = None
+                    return
+                running = self.tasks.get(asyncio.current_task(self.loop))
+                sampled = set()
+                for thread_id, frame in frames.items():
+                    is_loop_thread = thread_id == self.loop_thread_id
+                    trace = running if is_loop_thread else self.mongo_threads.get(thread_id)
+                    if trace is None or id(trace) in sampled:
+                        continue
+                    stack = thread_stack(frame)
+                    category = classify_sample(is_loop_thread, stack)
+                    if category in (None, "idle"):
+                        continue
+                    sampled.add(id(trace))
+                    trace["samples"][category] += 1
+                    trace["stacks"][fold_stack(category, stack)] += 1
+                for trace in self.tasks.values():
+                    if id(trace) not in sampled:
+                        trace["samples"]["waiting"] += 1
+
+    async def finish(self, trace: dict):
+        with self.lock:
+            self.tasks.pop(asyncio.current_task(), None)
+        samples = trace.pop("samples")
+        stacks = trace.pop("stacks")
+        # Written after every request: a serverless instance may be frozen
+        # as soon as the response is sent.
+        await get_db().profile_samples.insert_one({
+            **trace,
+            "instance": INSTANCE_ID,
+            "time_ms": {category: samples[category] * PROFILER_INTERVAL_MS for category in PROFILER_CATEGORIES},
+            "stacks": list(stacks.items()),
+            "created_at": datetime.utcnow()
+        })
+
+profiler = Profiler()
+
+def make_profiler_listener(profiler: Profiler):
+    from pymongo.monitoring import ConnectionPoolListener
+
+    class ProfilerPoolListener(ConnectionPoolListener):
+        # Pool events fire in the executor thread running the query, from
+        # check-out until the connection is returned.
+        def connection_check_out_started(self, event):
+            profiler.enter_mongo()
+
+        def connection_check_out_failed(self, event):
+            profiler.leave_mongo()
+
+        def connection_checked_in(self, event):
+            profiler.leave_mongo()
+
+        def pool_created(self, event): pass
+        def pool_ready(self, event): pass
+        def pool_cleared(self, event): pass
+        def pool_closed(self, event): pass
+        def connection_created(self, event): pass
+        def connection_ready(self, event): pass
+        def connection_closed(self, event): pass
+        def connection_checked_out(self, event): pass
+
+    return ProfilerPoolListener()
+
+async def warmup():
+    # Build the shared resources ahead of the first request and open one
+    # pooled connection so that request does not pay for the handshake.
+    get_pwd_context()
+    await get_db().command("ping")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    load_monitor.start()
+    if WARMUP_ON_STARTUP:
+        try:
+            await warmup()
+        except Exception as e:
+            logger.warning(f"Warmup failed: {e}")
+    yield
+    await load_monitor.stop()
+    close_client()
+
 # Create the main app without a prefix
-app = FastAPI(title="ABOU GENI API", description="Gestionnaire de Documents de Véhicules")
+app = FastAPI(title="ABOU GENI API", description="Gestionnaire de Documents de Véhicules", lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -78,6 +556,7 @@ class Document(BaseModel):
     date_emission: datetime
     date_expiration: datetime
     fichier_base64: Optional[str] = None
+    preview_id: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     user_id: str
 
@@ -99,12 +578,28 @@ class Alert(BaseModel):
     status: str = "active"  # active, dismissed
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class ProfileCaptureCreate(BaseModel):
+    route: Optional[str] = None  # path prefix, e.g. /api/search; every route if empty
+    duration_seconds: int = Field(default=60, gt=0, le=600)
+    max_requests: Optional[int] = Field(default=None, gt=0)
+
+class ProfileCapture(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    route: Optional[str] = None
+    max_requests: Optional[int] = None
+    requests: int = 0
+    interval_ms: float = PROFILER_INTERVAL_MS
+    status: str = "running"  # running, done
+    started_at: datetime = Field(default_factory=datetime.utcnow)
+    ends_at: datetime
+    created_by: str
+
 # Utility functions
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -114,6 +609,7 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    db = get_db()
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=["HS256"])
         username: str = payload.get("sub")
@@ -127,9 +623,15 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         raise HTTPException(status_code=401, detail="Utilisateur non trouvé")
     return User(**user)
 
+async def get_current_admin(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Accès réservé aux administrateurs")
+    return current_user
+
 # Authentication routes
 @api_router.post("/auth/register", response_model=User)
 async def register(user_data: UserCreate):
+    db = get_db()
     # Check if user exists
     existing_user = await db.users.find_one({"username": user_data.username})
     if existing_user:
@@ -139,6 +641,8 @@ async def register(user_data: UserCreate):
     hashed_password = get_password_hash(user_data.password)
     user_dict = user_data.dict()
     del user_dict["password"]
+    # Self-registration never grants privileges; admins come from /setup
+    user_dict["role"] = "user"
     user_obj = User(**user_dict)
     
     user_doc = user_obj.dict()
@@ -149,6 +653,7 @@ async def register(user_data: UserCreate):
 
 @api_router.post("/auth/login")
 async def login(user_data: UserLogin):
+    db = get_db()
     user = await db.users.find_one({"username": user_data.username})
     if not user or not verify_password(user_data.password, user["password"]):
         raise HTTPException(status_code=401, detail="Identifiants incorrects")
@@ -163,6 +668,7 @@ async def login(user_data: UserLogin):
 # Vehicle routes
 @api_router.post("/vehicles", response_model=Vehicle)
 async def create_vehicle(vehicle_data: VehicleCreate, current_user: User = Depends(get_current_user)):
+    db = get_db()
     vehicle_dict = vehicle_data.dict()
     vehicle_dict["user_id"] = current_user.id
     vehicle_obj = Vehicle(**vehicle_dict)
@@ -172,11 +678,13 @@ async def create_vehicle(vehicle_data: VehicleCreate, current_user: User = Depen
 
 @api_router.get("/vehicles", response_model=List[Vehicle])
 async def get_vehicles(current_user: User = Depends(get_current_user)):
+    db = get_db()
     vehicles = await db.vehicles.find({"user_id": current_user.id}).to_list(1000)
     return [Vehicle(**vehicle) for vehicle in vehicles]
 
 @api_router.get("/vehicles/{vehicle_id}", response_model=Vehicle)
 async def get_vehicle(vehicle_id: str, current_user: User = Depends(get_current_user)):
+    db = get_db()
     vehicle = await db.vehicles.find_one({"id": vehicle_id, "user_id": current_user.id})
     if not vehicle:
         raise HTTPException(status_code=404, detail="Véhicule non trouvé")
@@ -184,6 +692,7 @@ async def get_vehicle(vehicle_id: str, current_user: User = Depends(get_current_
 
 @api_router.put("/vehicles/{vehicle_id}", response_model=Vehicle)
 async def update_vehicle(vehicle_id: str, vehicle_data: VehicleCreate, current_user: User = Depends(get_current_user)):
+    db = get_db()
     vehicle = await db.vehicles.find_one({"id": vehicle_id, "user_id": current_user.id})
     if not vehicle:
         raise HTTPException(status_code=404, detail="Véhicule non trouvé")
@@ -198,17 +707,137 @@ async def update_vehicle(vehicle_id: str, vehicle_data: VehicleCreate, current_u
 
 @api_router.delete("/vehicles/{vehicle_id}")
 async def delete_vehicle(vehicle_id: str, current_user: User = Depends(get_current_user)):
+    db = get_db()
     result = await db.vehicles.delete_one({"id": vehicle_id, "user_id": current_user.id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Véhicule non trouvé")
     
     # Delete associated documents
+    preview_ids = await db.documents.distinct("preview_id", {"vehicle_id": vehicle_id, "user_id": current_user.id})
     await db.documents.delete_many({"vehicle_id": vehicle_id, "user_id": current_user.id})
+    for preview_id in preview_ids:
+        await drop_preview_if_unused(preview_id)
     return {"message": "Véhicule supprimé avec succès"}
 
+# Document previews
+# Scans are decoded once, in a thread pool so the event loop keeps serving,
+# and reduced to a small JPEG. Previews are addressed by the SHA-256 of the
+# scan, stored in the previews collection and kept hot in a per-instance LRU.
+PREVIEW_MAX_SIZE = int(os.environ.get('PREVIEW_MAX_SIZE', '256'))
+PREVIEW_WORKERS = int(os.environ.get('PREVIEW_WORKERS', '2'))
+PREVIEW_CACHE_MAX_BYTES = int(os.environ.get('PREVIEW_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+PREVIEW_MAX_AGE = int(os.environ.get('PREVIEW_MAX_AGE', '31536000'))
+# Stored as preview_id when a scan cannot be previewed, so it is not retried
+PREVIEW_UNAVAILABLE = ""
+
+class PreviewCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, preview_id: str) -> Optional[bytes]:
+        data = self.entries.get(preview_id)
+        if data is not None:
+            self.entries.move_to_end(preview_id)
+        return data
+
+    def put(self, preview_id: str, data: bytes):
+        if preview_id in self.entries:
+            self.entries.move_to_end(preview_id)
+            return
+        if len(data) > self.max_bytes:
+            return
+        self.entries[preview_id] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def discard(self, preview_id: str):
+        data = self.entries.pop(preview_id, None)
+        if data is not None:
+            self.size -= len(data)
+
+preview_cache = PreviewCache(PREVIEW_CACHE_MAX_BYTES)
+
+@lru_cache(maxsize=None)
+def get_preview_executor():
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=PREVIEW_WORKERS, thread_name_prefix="preview")
+
+def decode_scan(fichier_base64: str):
+    """Return the raw scan and its preview id, accepting plain base64 or a data URL."""
+    if fichier_base64.startswith("data:"):
+        fichier_base64 = fichier_base64.split(",", 1)[-1]
+    scan = base64.b64decode(fichier_base64)
+    return scan, hashlib.sha256(scan).hexdigest()
+
+def render_preview(scan: bytes) -> bytes:
+    from PIL import Image, ImageOps
+    if scan.startswith(b"%PDF"):
+        import pypdfium2 as pdfium
+        pdf = pdfium.PdfDocument(scan)
+        try:
+            page = pdf[0]
+            image = page.render(scale=PREVIEW_MAX_SIZE / max(page.get_size())).to_pil()
+        finally:
+            pdf.close()
+    else:
+        image = Image.open(io.BytesIO(scan))
+        # Let the JPEG decoder downscale while reading instead of decoding full size.
+        image.draft("RGB", (PREVIEW_MAX_SIZE, PREVIEW_MAX_SIZE))
+        # Phone photos are stored sideways with the rotation in EXIF
+        image = ImageOps.exif_transpose(image)
+    image = image.convert("RGB")
+    image.thumbnail((PREVIEW_MAX_SIZE, PREVIEW_MAX_SIZE))
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=80, optimize=True)
+    return output.getvalue()
+
+async def store_preview(fichier_base64: Optional[str]) -> Optional[str]:
+    """Make sure the preview of a scan exists and return its id.
+
+    Returns None when there is no scan and PREVIEW_UNAVAILABLE when it cannot be previewed.
+    """
+    if not fichier_base64:
+        return None
+    loop = asyncio.get_running_loop()
+    executor = get_preview_executor()
+    try:
+        scan, preview_id = await loop.run_in_executor(executor, decode_scan, fichier_base64)
+    except (binascii.Error, ValueError):
+        logger.warning("Document scan is not valid base64, no preview generated")
+        return PREVIEW_UNAVAILABLE
+
+    db = get_db()
+    if preview_cache.get(preview_id) is not None or await db.previews.find_one({"_id": preview_id}, {"_id": 1}):
+        return preview_id
+
+    try:
+        data = await loop.run_in_executor(executor, render_preview, scan)
+    except Exception as e:
+        logger.warning(f"Could not render preview {preview_id}: {e}")
+        return PREVIEW_UNAVAILABLE
+
+    await db.previews.update_one(
+        {"_id": preview_id},
+        {"$setOnInsert": {"data": data, "content_type": "image/jpeg", "created_at": datetime.utcnow()}},
+        upsert=True
+    )
+    preview_cache.put(preview_id, data)
+    return preview_id
+
+async def drop_preview_if_unused(preview_id: Optional[str]):
+    db = get_db()
+    if preview_id and not await db.documents.find_one({"preview_id": preview_id}, {"_id": 1}):
+        await db.previews.delete_one({"_id": preview_id})
+        preview_cache.discard(preview_id)
+
 # Document routes
 @api_router.post("/documents", response_model=Document)
 async def create_document(document_data: DocumentCreate, current_user: User = Depends(get_current_user)):
+    db = get_db()
     # Verify vehicle exists and belongs to user
     vehicle = await db.vehicles.find_one({"id": document_data.vehicle_id, "user_id": current_user.id})
     if not vehicle:
@@ -217,6 +846,7 @@ async def create_document(document_data: DocumentCreate, current_user: User = De
     document_dict = document_data.dict()
     document_dict["user_id"] = current_user.id
     document_obj = Document(**document_dict)
+    document_obj.preview_id = await store_preview(document_obj.fichier_base64)
     
     await db.documents.insert_one(document_obj.dict())
     
@@ -227,30 +857,82 @@ async def create_document(document_data: DocumentCreate, current_user: User = De
 
 @api_router.get("/documents", response_model=List[Document])
 async def get_documents(vehicle_id: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    db = get_db()
     query = {"user_id": current_user.id}
     if vehicle_id:
         query["vehicle_id"] = vehicle_id
     
-    documents = await db.documents.find(query).to_list(1000)
+    # Lists carry preview_id only; the scan itself is served by GET /documents/{id}
+    documents = await db.documents.find(query, {"fichier_base64": 0}).to_list(1000)
     return [Document(**document) for document in documents]
 
 @api_router.get("/documents/{document_id}", response_model=Document)
 async def get_document(document_id: str, current_user: User = Depends(get_current_user)):
+    db = get_db()
     document = await db.documents.find_one({"id": document_id, "user_id": current_user.id})
     if not document:
         raise HTTPException(status_code=404, detail="Document non trouvé")
     return Document(**document)
 
+@api_router.get("/documents/{document_id}/preview")
+async def get_document_preview(document_id: str, request: Request, v: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    db = get_db()
+    query = {"id": document_id, "user_id": current_user.id}
+    document = await db.documents.find_one(query, {"preview_id": 1})
+    if not document:
+        raise HTTPException(status_code=404, detail="Document non trouvé")
+
+    preview_id = document.get("preview_id")
+    if preview_id == PREVIEW_UNAVAILABLE:
+        raise HTTPException(status_code=404, detail="Aucun aperçu disponible")
+    data = preview_cache.get(preview_id) if preview_id else None
+    if data is None and preview_id:
+        preview = await db.previews.find_one({"_id": preview_id})
+        if preview:
+            data = preview["data"]
+            preview_cache.put(preview_id, data)
+    if data is None:
+        # Documents stored before previews existed, or whose preview was lost
+        scan = await db.documents.find_one(query, {"fichier_base64": 1})
+        if not scan:
+            raise HTTPException(status_code=404, detail="Document non trouvé")
+        preview_id = await store_preview(scan.get("fichier_base64"))
+        if preview_id is None:
+            raise HTTPException(status_code=404, detail="Aucun aperçu disponible")
+        await db.documents.update_one(query, {"$set": {"preview_id": preview_id}})
+        if preview_id == PREVIEW_UNAVAILABLE:
+            raise HTTPException(status_code=404, detail="Aucun aperçu disponible")
+        data = preview_cache.get(preview_id)
+        if data is None:
+            data = (await db.previews.find_one({"_id": preview_id}))["data"]
+
+    etag = f'"{preview_id}"'
+    # The response never changes for a given preview id, so a URL carrying it
+    # as ?v= can be cached for good; otherwise clients revalidate with the ETag.
+    if v == preview_id:
+        cache_control = f"private, max-age={PREVIEW_MAX_AGE}, immutable"
+    else:
+        cache_control = "private, no-cache"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=data, media_type="image/jpeg", headers=headers)
+
 @api_router.put("/documents/{document_id}", response_model=Document)
 async def update_document(document_id: str, document_data: DocumentCreate, current_user: User = Depends(get_current_user)):
+    db = get_db()
     document = await db.documents.find_one({"id": document_id, "user_id": current_user.id})
     if not document:
         raise HTTPException(status_code=404, detail="Document non trouvé")
     
+    # Content addressed: an unchanged scan keeps its preview, a new one is rendered
+    preview_id = await store_preview(document_data.fichier_base64)
     await db.documents.update_one(
         {"id": document_id, "user_id": current_user.id},
-        {"$set": document_data.dict()}
+        {"$set": {**document_data.dict(), "preview_id": preview_id}}
     )
+    if document.get("preview_id") != preview_id:
+        await drop_preview_if_unused(document.get("preview_id"))
     
     updated_document = await db.documents.find_one({"id": document_id, "user_id": current_user.id})
     document_obj = Document(**updated_document)
@@ -263,16 +945,22 @@ async def update_document(document_id: str, document_data: DocumentCreate, curre
 
 @api_router.delete("/documents/{document_id}")
 async def delete_document(document_id: str, current_user: User = Depends(get_current_user)):
-    result = await db.documents.delete_one({"id": document_id, "user_id": current_user.id})
-    if result.deleted_count == 0:
+    db = get_db()
+    document = await db.documents.find_one_and_delete(
+        {"id": document_id, "user_id": current_user.id},
+        {"preview_id": 1}
+    )
+    if not document:
         raise HTTPException(status_code=404, detail="Document non trouvé")
     
     # Delete associated alerts
     await db.alerts.delete_many({"document_id": document_id})
+    await drop_preview_if_unused(document.get("preview_id"))
     return {"message": "Document supprimé avec succès"}
 
 # Alert functions
 async def create_alerts_for_document(document: Document):
+    db = get_db()
     now = datetime.utcnow()
     alerts = []
     
@@ -311,6 +999,7 @@ async def create_alerts_for_document(document: Document):
 # Alerts routes
 @api_router.get("/alerts", response_model=List[Alert])
 async def get_alerts(current_user: User = Depends(get_current_user)):
+    db = get_db()
     # Get user's vehicles
     user_vehicles = await db.vehicles.find({"user_id": current_user.id}).to_list(1000)
     vehicle_ids = [v["id"] for v in user_vehicles]
@@ -326,6 +1015,7 @@ async def get_alerts(current_user: User = Depends(get_current_user)):
 
 @api_router.put("/alerts/{alert_id}/dismiss")
 async def dismiss_alert(alert_id: str, current_user: User = Depends(get_current_user)):
+    db = get_db()
     result = await db.alerts.update_one(
         {"id": alert_id},
         {"$set": {"status": "dismissed"}}
@@ -339,6 +1029,7 @@ async def dismiss_alert(alert_id: str, current_user: User = Depends(get_current_
 # Statistics routes
 @api_router.get("/statistics")
 async def get_statistics(current_user: User = Depends(get_current_user)):
+    db = get_db()
     # Get user's vehicles and documents
     vehicles_count = await db.vehicles.count_documents({"user_id": current_user.id})
     documents_count = await db.documents.count_documents({"user_id": current_user.id})
@@ -369,6 +1060,7 @@ async def get_statistics(current_user: User = Depends(get_current_user)):
 # Search route
 @api_router.get("/search")
 async def search(q: str, current_user: User = Depends(get_current_user)):
+    db = get_db()
     vehicles = await db.vehicles.find({
         "user_id": current_user.id,
         "$or": [
@@ -385,7 +1077,7 @@ async def search(q: str, current_user: User = Depends(get_current_user)):
             {"type_document": {"$regex": q, "$options": "i"}},
             {"numero_document": {"$regex": q, "$options": "i"}}
         ]
-    }).to_list(100)
+    }, {"fichier_base64": 0}).to_list(100)
     
     return {
         "vehicles": [Vehicle(**v) for v in vehicles],
@@ -395,6 +1087,7 @@ async def search(q: str, current_user: User = Depends(get_current_user)):
 # Create default admin user
 @api_router.post("/setup")
 async def setup_default_user():
+    db = get_db()
     # Check if admin already exists
     admin = await db.users.find_one({"username": "admin"})
     if admin:
@@ -419,9 +1112,166 @@ async def setup_default_user():
     await db.users.insert_one(user_doc)
     return {"message": "Admin user created successfully"}
 
+# Admin profiler routes
+def capture_status(capture: dict) -> ProfileCapture:
+    capture = ProfileCapture(**capture)
+    if capture.ends_at <= datetime.utcnow():
+        capture.status = "done"
+    return capture
+
+@api_router.post("/admin/profiler/captures", response_model=ProfileCapture)
+async def start_profile_capture(capture_data: ProfileCaptureCreate, current_user: User = Depends(get_current_admin)):
+    db = get_db()
+    # Only one capture runs at a time
+    await db.profile_captures.update_many({"status": "running"}, {"$set": {"status": "done"}})
+    capture_obj = ProfileCapture(
+        route=capture_data.route,
+        max_requests=capture_data.max_requests,
+        ends_at=datetime.utcnow() + timedelta(seconds=capture_data.duration_seconds),
+        created_by=current_user.username
+    )
+    await db.profile_captures.insert_one(capture_obj.dict())
+    await profiler.refresh()
+    return capture_obj
+
+@api_router.get("/admin/profiler/captures", response_model=List[ProfileCapture])
+async def get_profile_captures(current_user: User = Depends(get_current_admin)):
+    db = get_db()
+    captures = await db.profile_captures.find().sort("started_at", -1).to_list(100)
+    return [capture_status(capture) for capture in captures]
+
+@api_router.get("/admin/profiler/captures/{capture_id}")
+async def get_profile_capture(capture_id: str, current_user: User = Depends(get_current_admin)):
+    db = get_db()
+    capture = await db.profile_captures.find_one({"id": capture_id})
+    if not capture:
+        raise HTTPException(status_code=404, detail="Capture non trouvée")
+    capture = capture_status(capture)
+
+    time_ms = Counter()
+    traces = await db.profile_samples.find(
+        {"capture_id": capture_id},
+        {"_id": 0, "stacks": 0, "capture_id": 0}
+    ).sort("started_at", 1).to_list(1000)
+    for trace in traces:
+        time_ms.update(trace["time_ms"])
+    return {
+        "capture": capture,
+        "time_ms": {category: time_ms[category] for category in PROFILER_CATEGORIES},
+        "traces": traces
+    }
+
+@api_router.get("/admin/profiler/captures/{capture_id}/flamegraph")
+async def download_profile_capture(capture_id: str, current_user: User = Depends(get_current_admin)):
+    db = get_db()
+    if not await db.profile_captures.find_one({"id": capture_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Capture non trouvée")
+
+    stacks = Counter()
+    async for sample in db.profile_samples.find({"capture_id": capture_id}, {"stacks": 1}):
+        stacks.update(dict(sample["stacks"]))
+    return PlainTextResponse(
+        "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()),
+        headers={"Content-Disposition": f'attachment; filename="{capture_id}.folded"'}
+    )
+
+@api_router.post("/admin/profiler/captures/{capture_id}/stop", response_model=ProfileCapture)
+async def stop_profile_capture(capture_id: str, current_user: User = Depends(get_current_admin)):
+    from pymongo import ReturnDocument
+    db = get_db()
+    capture = await db.profile_captures.find_one_and_update(
+        {"id": capture_id},
+        {"$set": {"status": "done", "ends_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not capture:
+        raise HTTPException(status_code=404, detail="Capture non trouvée")
+    await profiler.refresh()
+    return ProfileCapture(**capture)
+
+# Health routes
+@api_router.get("/health/live")
+async def health_live():
+    # Liveness only tells that the process answers; it never touches MongoDB.
+    return {"status": "ok"}
+
+@api_router.get("/health/ready")
+async def health_ready():
+    try:
+        await get_db().command("ping")
+    except Exception as e:
+        logger.warning(f"Readiness check failed: {e}")
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "unavailable", "database": "unreachable"}
+        )
+    return {"status": "ok", "database": "ok"}
+
 # Include the router in the main app
 app.include_router(api_router)
 
+class ProfilerMiddleware:
+    # Plain ASGI rather than @app.middleware: this wraps every request and
+    # must cost next to nothing while no capture is running.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not path.startswith("/api/") or path.startswith(PROFILER_EXEMPT_PATHS):
+            return await self.app(scope, receive, send)
+
+        capture_id = await profiler.admit(path)
+        if capture_id is None:
+            return await self.app(scope, receive, send)
+
+        trace = {
+            "capture_id": capture_id,
+            "method": scope["method"],
+            "path": path,
+            "status_code": 500,
+            "started_at": datetime.utcnow(),
+            "samples": Counter(),
+            "stacks": Counter()
+        }
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                trace["status_code"] = message["status"]
+            await send(message)
+
+        token = profiled_request.set(trace)
+        profiler.start_sampling(trace)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            profiled_request.reset(token)
+            trace["duration_ms"] = (time.perf_counter() - started) * 1000
+            await profiler.finish(trace)
+
+app.add_middleware(ProfilerMiddleware)
+
+@app.middleware("http")
+async def rate_limit(request, call_next):
+    path = request.url.path
+    if not RATE_LIMIT_ENABLED or not path.startswith("/api/") or path.startswith(RATE_LIMIT_EXEMPT_PATHS):
+        return await call_next(request)
+
+    load_monitor.start()
+    if load_monitor.overloaded():
+        return too_many_requests("Serveur surchargé, veuillez réessayer", SHED_RETRY_AFTER_SECONDS)
+
+    tenant = get_tenant(request)
+    route_class = get_route_class(path)
+    retry_after = await rate_limiter.acquire(tenant, route_class)
+    if retry_after:
+        return too_many_requests("Trop de requêtes, veuillez réessayer", retry_after)
+    try:
+        return await call_next(request)
+    finally:
+        rate_limiter.release(tenant, route_class)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -429,14 +1279,3 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
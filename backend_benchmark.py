@@ -0,0 +1,129 @@
+import subprocess
+import statistics
+import sys
+import json
+import os
+
+# Benchmarks run against the backend module in fresh interpreters, so that
+# each run measures a cold start the way a new serverless instance sees it.
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+RUNS = int(os.environ.get('BENCH_RUNS', '5'))
+
+IMPORT_SCRIPT = """
+import json, time
+t0 = time.perf_counter()
+import server
+print(json.dumps({"import_ms": (time.perf_counter() - t0) * 1000}))
+"""
+
+FIRST_REQUEST_SCRIPT = """
+import asyncio, json, time
+t0 = time.perf_counter()
+import server
+import httpx
+import_ms = (time.perf_counter() - t0) * 1000
+
+async def timed(client, path):
+    t = time.perf_counter()
+    response = await client.get(path)
+    return response.status_code, (time.perf_counter() - t) * 1000
+
+async def main():
+    # No lifespan here: this is the path taken when the platform does not
+    # run startup events and everything is initialised by the first request.
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        results = {"import_ms": import_ms}
+        results["live_first"] = await timed(client, "/api/health/live")
+        results["live_warm"] = await timed(client, "/api/health/live")
+        results["ready_first"] = await timed(client, "/api/health/ready")
+        results["ready_warm"] = await timed(client, "/api/health/ready")
+        t = time.perf_counter()
+        server.get_password_hash("benchmark")
+        results["first_hash_ms"] = (time.perf_counter() - t) * 1000
+    print(json.dumps(results))
+
+asyncio.run(main())
+"""
+
+RATE_LIMIT_SCRIPT = """
+import asyncio, json, time
+import server
+import httpx
+
+REQUESTS = 2000
+
+async def main():
+    # Limits high enough that nothing is rejected: this measures the cost of
+    # the middleware itself on a route that never reaches MongoDB.
+    for route_class in server.ROUTE_CLASS_LIMITS:
+        server.ROUTE_CLASS_LIMITS[route_class] = (1e9, 1e9, 1000)
+    headers = {"Authorization": "Bearer " + server.create_access_token({"sub": "bench"})}
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.get("/api/bench", headers=headers)
+        t = time.perf_counter()
+        for _ in range(REQUESTS):
+            await client.get("/api/bench", headers=headers)
+        request_us = (time.perf_counter() - t) / REQUESTS * 1e6
+    t = time.perf_counter()
+    for _ in range(REQUESTS):
+        await server.rate_limiter.acquire("user:bench", "search")
+        server.rate_limiter.release("user:bench", "search")
+    acquire_us = (time.perf_counter() - t) / REQUESTS * 1e6
+    print(json.dumps({"request_us": request_us, "acquire_us": acquire_us}))
+
+asyncio.run(main())
+"""
+
+def print_test_header(test_name):
+    print(f"\n{'=' * 80}")
+    print(f"BENCHMARK: {test_name}")
+    print(f"{'=' * 80}")
+
+def run_script(script, env=None):
+    output = subprocess.run(
+        [sys.executable, '-c', script],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **(env or {})},
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def summarize(name, values, unit="ms"):
+    print(f"{name:<24} min={min(values):8.1f} {unit}  median={statistics.median(values):8.1f} {unit}  max={max(values):8.1f} {unit}")
+
+def bench_import():
+    print_test_header(f"Cold import of server.py ({RUNS} runs)")
+    values = [run_script(IMPORT_SCRIPT)["import_ms"] for _ in range(RUNS)]
+    summarize("import", values)
+    return values
+
+def bench_first_request():
+    print_test_header(f"First request latency ({RUNS} runs)")
+    runs = [run_script(FIRST_REQUEST_SCRIPT) for _ in range(RUNS)]
+    summarize("import", [r["import_ms"] for r in runs])
+    for key in ("live_first", "live_warm", "ready_first", "ready_warm"):
+        statuses = sorted({r[key][0] for r in runs})
+        summarize(f"{key} {statuses}", [r[key][1] for r in runs])
+    summarize("first bcrypt hash", [r["first_hash_ms"] for r in runs])
+    return runs
+
+def bench_rate_limit():
+    print_test_header(f"Rate limiter overhead ({RUNS} runs)")
+    enabled = [run_script(RATE_LIMIT_SCRIPT) for _ in range(RUNS)]
+    disabled = [run_script(RATE_LIMIT_SCRIPT, {"RATE_LIMIT_ENABLED": "false"}) for _ in range(RUNS)]
+    summarize("request, limiter on", [r["request_us"] for r in enabled], "us")
+    summarize("request, limiter off", [r["request_us"] for r in disabled], "us")
+    summarize("acquire + release", [r["acquire_us"] for r in enabled], "us")
+    return enabled, disabled
+
+def run_all_benchmarks():
+    bench_import()
+    bench_first_request()
+    bench_rate_limit()
+
+if __name__ == "__main__":
+    run_all_benchmarks()
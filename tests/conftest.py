@@ -0,0 +1,25 @@
+import sys
+from pathlib import Path
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """Replace MongoDB with an in-memory stand-in for the duration of a test."""
+    mock_db = AsyncMongoMockClient()["test_database"]
+    monkeypatch.setattr(server, "get_db", lambda: mock_db)
+    return mock_db
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Freeze time.monotonic; advance it by assigning clock[0]."""
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    return now
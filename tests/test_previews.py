@@ -0,0 +1,172 @@
+import asyncio
+import base64
+import io
+
+import httpx
+import pypdfium2 as pdfium
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+import server
+
+
+def jpeg_scan(color, size=(1200, 900)):
+    output = io.BytesIO()
+    Image.new("RGB", size, color).save(output, "JPEG")
+    return "data:image/jpeg;base64," + base64.b64encode(output.getvalue()).decode()
+
+
+def pdf_scan():
+    pdf = pdfium.PdfDocument.new()
+    pdf.new_page(595, 842)
+    output = io.BytesIO()
+    pdf.save(output)
+    return base64.b64encode(output.getvalue()).decode()
+
+
+def rotated_jpeg_scan():
+    """A landscape JPEG whose EXIF says to display it rotated to portrait."""
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise
+    output = io.BytesIO()
+    Image.new("RGB", (800, 400), "green").save(output, "JPEG", exif=exif)
+    return base64.b64encode(output.getvalue()).decode()
+
+
+def test_preview_cache_accounts_bytes_and_evicts_least_recently_used():
+    cache = server.PreviewCache(max_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    cache.get("a")
+    cache.put("c", b"cccc")
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.size == 8
+    cache.discard("a")
+    assert cache.size == 4
+    cache.put("huge", b"x" * 11)
+    assert cache.get("huge") is None
+    assert cache.size == 4
+
+
+def test_render_preview_bounds_images_and_pdf_pages():
+    for fichier_base64 in (jpeg_scan("red"), pdf_scan()):
+        scan, _ = server.decode_scan(fichier_base64)
+        preview = Image.open(io.BytesIO(server.render_preview(scan)))
+        assert preview.format == "JPEG"
+        assert max(preview.size) == server.PREVIEW_MAX_SIZE
+
+
+def test_render_preview_applies_exif_orientation():
+    scan, _ = server.decode_scan(rotated_jpeg_scan())
+    preview = Image.open(io.BytesIO(server.render_preview(scan)))
+    assert preview.size == (server.PREVIEW_MAX_SIZE // 2, server.PREVIEW_MAX_SIZE)
+
+
+async def login(client):
+    await client.post("/api/setup")
+    response = await client.post("/api/auth/login", json={"username": "admin", "password": "admin123"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_update_and_delete_regenerate_and_clean_up_previews(db, monkeypatch):
+    monkeypatch.setattr(server, "preview_cache", server.PreviewCache(server.PREVIEW_CACHE_MAX_BYTES))
+
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            headers = await login(client)
+            vehicle = (await client.post("/api/vehicles", headers=headers, json={
+                "marque": "Renault", "modele": "Master", "immatriculation": "AB-123-CD",
+                "type_vehicule": "camionnette", "proprietaire": "ABOU GENI"
+            })).json()
+            document_data = {
+                "vehicle_id": vehicle["id"],
+                "type_document": "assurance",
+                "numero_document": "ASS-001",
+                "date_emission": "2024-01-01T00:00:00",
+                "date_expiration": "2030-01-01T00:00:00",
+                "fichier_base64": jpeg_scan("red"),
+            }
+            document = (await client.post("/api/documents", headers=headers, json=document_data)).json()
+            first_preview = document["preview_id"]
+            assert first_preview
+
+            listed = (await client.get("/api/documents", headers=headers)).json()
+            assert listed[0]["fichier_base64"] is None
+            assert listed[0]["preview_id"] == first_preview
+
+            response = await client.get(f"/api/documents/{document['id']}/preview?v={first_preview}", headers=headers)
+            assert response.headers["content-type"] == "image/jpeg"
+            assert "immutable" in response.headers["cache-control"]
+
+            # Same file: the preview is kept
+            document = (await client.put(f"/api/documents/{document['id']}", headers=headers, json=document_data)).json()
+            assert document["preview_id"] == first_preview
+
+            # New file: a new preview replaces the old one
+            document_data["fichier_base64"] = jpeg_scan("blue")
+            document = (await client.put(f"/api/documents/{document['id']}", headers=headers, json=document_data)).json()
+            second_preview = document["preview_id"]
+            assert second_preview != first_preview
+            assert [p["_id"] for p in await db.previews.find().to_list(10)] == [second_preview]
+            assert server.preview_cache.get(first_preview) is None
+
+            await client.delete(f"/api/documents/{document['id']}", headers=headers)
+            assert await db.previews.count_documents({}) == 0
+            assert server.preview_cache.get(second_preview) is None
+
+    asyncio.run(run())
+
+
+def test_unrenderable_scan_is_not_decoded_again(db, monkeypatch):
+    renders = []
+    render_preview = server.render_preview
+    monkeypatch.setattr(server, "render_preview", lambda scan: renders.append(scan) or render_preview(scan))
+
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            headers = await login(client)
+            vehicle = (await client.post("/api/vehicles", headers=headers, json={
+                "marque": "Renault", "modele": "Master", "immatriculation": "AB-123-CD",
+                "type_vehicule": "camionnette", "proprietaire": "ABOU GENI"
+            })).json()
+            document = (await client.post("/api/documents", headers=headers, json={
+                "vehicle_id": vehicle["id"],
+                "type_document": "assurance",
+                "numero_document": "ASS-001",
+                "date_emission": "2024-01-01T00:00:00",
+                "date_expiration": "2030-01-01T00:00:00",
+                "fichier_base64": base64.b64encode(b"not an image").decode(),
+            })).json()
+            statuses = [
+                (await client.get(f"/api/documents/{document['id']}/preview", headers=headers)).status_code
+                for _ in range(3)
+            ]
+            return document, statuses
+
+    document, statuses = asyncio.run(run())
+    assert document["preview_id"] == server.PREVIEW_UNAVAILABLE
+    assert statuses == [404, 404, 404]
+    assert len(renders) == 1
+
+
+def test_preview_of_document_deleted_meanwhile_is_not_found(monkeypatch):
+    class VanishingDocuments:
+        def __init__(self):
+            self.reads = 0
+
+        async def find_one(self, query, projection=None):
+            self.reads += 1
+            # Stored before previews existed, then deleted before the scan is read
+            return {"preview_id": None} if self.reads == 1 else None
+
+    class Database:
+        documents = VanishingDocuments()
+
+    monkeypatch.setattr(server, "get_db", lambda: Database())
+    user = server.User(username="admin", email="admin@abougeni.org", role="admin")
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(server.get_document_preview("document", request=None, current_user=user))
+    assert error.value.status_code == 404
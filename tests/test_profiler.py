@@ -0,0 +1,144 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import Counter
+
+import httpx
+import pytest
+
+import server
+
+
+def fake_function(filename):
+    """A function whose code reports the given file, as if it came from that module."""
+    namespace = {}
+    exec(compile("def select(event=None):\n    event.wait()\n", filename, "exec"), namespace)
+    return namespace["select"]
+
+
+pymongo_query = fake_function("/site-packages/pymongo/network.py")
+pymongo_monitor = fake_function("/site-packages/pymongo/periodic_executor.py")
+bcrypt_hash = fake_function("/site-packages/passlib/handlers/bcrypt.py")
+selector_select = fake_function("/lib/python3/selectors.py")
+
+
+def test_classify_sample():
+    here = test_classify_sample.__code__
+    assert server.classify_sample(True, [here, selector_select.__code__]) == "idle"
+    assert server.classify_sample(True, [here, bcrypt_hash.__code__]) == "blocking"
+    assert server.classify_sample(True, [here]) == "event_loop"
+    assert server.classify_sample(False, [here, pymongo_query.__code__]) == "mongo"
+    assert server.classify_sample(False, [pymongo_monitor.__code__, pymongo_query.__code__]) is None
+    assert server.classify_sample(False, [here]) is None
+
+
+def new_trace():
+    return {"capture_id": "capture", "method": "GET", "path": "/api/search",
+            "started_at": None, "samples": Counter(), "stacks": Counter()}
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def captured_work():
+    busy(0.1)
+
+
+def unrelated_work():
+    busy(0.1)
+
+
+def test_samples_only_the_captured_request(db, monkeypatch):
+    profiler = server.Profiler()
+    monkeypatch.setattr(server, "profiler", profiler)
+    trace = new_trace()
+
+    async def captured():
+        profiler.start_sampling(trace)
+        await asyncio.sleep(0.02)
+        captured_work()
+        await asyncio.sleep(0.02)
+        await profiler.finish(trace)
+
+    async def unrelated():
+        await asyncio.sleep(0.03)
+        unrelated_work()
+
+    async def run():
+        await asyncio.gather(captured(), unrelated())
+        return await db.profile_samples.find_one()
+
+    sample = asyncio.run(run())
+    folded = [stack for stack, _ in sample["stacks"]]
+    assert any("captured_work" in stack for stack in folded)
+    assert not any("unrelated_work" in stack for stack in folded)
+    assert sample["time_ms"]["event_loop"] >= 50
+    # Queued behind unrelated_work while it held the loop
+    assert sample["time_ms"]["waiting"] >= 50
+
+
+def test_mongo_threads_are_charged_to_the_request_that_queries(db, monkeypatch):
+    profiler = server.Profiler()
+    monkeypatch.setattr(server, "profiler", profiler)
+    trace = new_trace()
+    query_running = threading.Event()
+    release = threading.Event()
+
+    def query():
+        # What motor does: the request's context is copied to the executor thread
+        profiler.enter_mongo()
+        query_running.set()
+        try:
+            pymongo_query(release)
+        finally:
+            profiler.leave_mongo()
+
+    async def run():
+        token = server.profiled_request.set(trace)
+        profiler.start_sampling(trace)
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        future = loop.run_in_executor(None, context.run, query)
+        await loop.run_in_executor(None, query_running.wait)
+        await asyncio.sleep(0.1)
+        release.set()
+        await future
+        server.profiled_request.reset(token)
+        await profiler.finish(trace)
+        return await db.profile_samples.find_one()
+
+    sample = asyncio.run(run())
+    assert sample["time_ms"]["mongo"] >= 50
+    assert any(stack.startswith("[mongo]") and "network.py:select" in stack for stack, _ in sample["stacks"])
+    assert profiler.mongo_threads == {}
+
+
+@pytest.fixture
+def client(db):
+    async def make():
+        transport = httpx.ASGITransport(app=server.app)
+        return httpx.AsyncClient(transport=transport, base_url="http://test")
+    return make
+
+
+def test_self_registered_users_cannot_reach_admin_routes(client):
+    async def run():
+        async with await client() as c:
+            registered = (await c.post("/api/auth/register", json={
+                "username": "mallory", "email": "m@example.org", "password": "secret", "role": "admin"
+            })).json()
+            login = (await c.post("/api/auth/login", json={"username": "mallory", "password": "secret"})).json()
+            headers = {"Authorization": f"Bearer {login['access_token']}"}
+            statuses = [
+                (await c.post("/api/admin/profiler/captures", headers=headers, json={})).status_code,
+                (await c.get("/api/admin/profiler/captures", headers=headers)).status_code,
+            ]
+            return registered["role"], statuses
+
+    role, statuses = asyncio.run(run())
+    assert role == "user"
+    assert statuses == [403, 403]
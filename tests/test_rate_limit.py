@@ -0,0 +1,157 @@
+import asyncio
+import threading
+
+import pytest
+from starlette.requests import Request
+
+import server
+
+
+def test_take_token_spends_burst_then_asks_to_wait(clock):
+    backend = server.InMemoryRateLimitBackend()
+    assert asyncio.run(backend.take_token("user:a:search", 2, 2)) == 0
+    assert asyncio.run(backend.take_token("user:a:search", 2, 2)) == 0
+    assert asyncio.run(backend.take_token("user:a:search", 2, 2)) == pytest.approx(0.5)
+
+
+def test_take_token_refills_with_time(clock):
+    backend = server.InMemoryRateLimitBackend()
+    asyncio.run(backend.take_token("user:a:search", 1, 1))
+    clock[0] += 0.25
+    assert asyncio.run(backend.take_token("user:a:search", 1, 1)) == pytest.approx(0.75)
+    clock[0] += 0.75
+    assert asyncio.run(backend.take_token("user:a:search", 1, 1)) == 0
+
+
+def test_take_token_keeps_tenants_apart(clock):
+    backend = server.InMemoryRateLimitBackend()
+    asyncio.run(backend.take_token("user:a:search", 1, 1))
+    assert asyncio.run(backend.take_token("user:b:search", 1, 1)) == 0
+
+
+def test_evict_drops_refilled_buckets_first(clock):
+    backend = server.InMemoryRateLimitBackend()
+    backend.max_buckets = 2
+    # A drained slow bucket takes 100 s to refill
+    for _ in range(10):
+        asyncio.run(backend.take_token("slow", 0.1, 10))
+    asyncio.run(backend.take_token("fast", 10, 10))
+    clock[0] += 60
+    asyncio.run(backend.take_token("new", 1, 1))
+    assert list(backend.buckets) == ["slow", "new"]
+
+
+def test_evict_enforces_cap_on_least_recently_used(clock):
+    backend = server.InMemoryRateLimitBackend()
+    backend.max_buckets = 2
+    asyncio.run(backend.take_token("a", 1, 5))
+    asyncio.run(backend.take_token("b", 1, 5))
+    asyncio.run(backend.take_token("a", 1, 5))
+    asyncio.run(backend.take_token("c", 1, 5))
+    assert list(backend.buckets) == ["a", "c"]
+
+
+@pytest.mark.parametrize("retry_after, header", [(0.2, "1"), (1.0, "1"), (2.3, "3")])
+def test_too_many_requests_rounds_retry_after_up(retry_after, header):
+    response = server.too_many_requests("Trop de requêtes", retry_after)
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == header
+
+
+def test_rate_limiter_caps_concurrent_requests(monkeypatch):
+    monkeypatch.setitem(server.ROUTE_CLASS_LIMITS, "search", (100, 100, 1))
+    limiter = server.RateLimiter(server.InMemoryRateLimitBackend())
+    assert asyncio.run(limiter.acquire("user:a", "search")) == 0
+    assert asyncio.run(limiter.acquire("user:a", "search")) == server.SHED_RETRY_AFTER_SECONDS
+    assert asyncio.run(limiter.acquire("user:b", "search")) == 0
+    limiter.release("user:a", "search")
+    assert asyncio.run(limiter.acquire("user:a", "search")) == 0
+
+
+def test_rate_limit_middleware_releases_slot_when_route_fails(monkeypatch):
+    monkeypatch.setitem(server.ROUTE_CLASS_LIMITS, "search", (100, 100, 1))
+    monkeypatch.setattr(server, "rate_limiter", server.RateLimiter(server.InMemoryRateLimitBackend()))
+    request = Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/api/search",
+        "headers": [],
+        "client": ("127.0.0.1", 1234),
+    })
+
+    async def failing_route(request):
+        raise RuntimeError("boom")
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await server.rate_limit(request, failing_route)
+
+    asyncio.run(run())
+    assert server.rate_limiter.active == {}
+
+
+def test_get_route_class():
+    assert server.get_route_class("/api/search") == "search"
+    assert server.get_route_class("/api/documents/1/preview") == "documents"
+    assert server.get_route_class("/api/vehicles") == "default"
+
+
+def test_mongo_backend_shares_buckets_and_expires_them(db):
+    backend = server.MongoRateLimitBackend()
+
+    async def run():
+        results = [await backend.take_token("user:a:search", 1, 2) for _ in range(3)]
+        return results, await db.rate_limits.index_information()
+
+    results, indexes = asyncio.run(run())
+    assert results[:2] == [0, 0]
+    assert 0.9 < results[2] <= 1
+    ttl = max(-(-burst // rate) for rate, burst, _ in server.ROUTE_CLASS_LIMITS.values())
+    assert indexes["last_1"]["expireAfterSeconds"] == ttl
+
+
+class SlowBackend:
+    """A backend that yields to the event loop, like a round-trip to MongoDB."""
+
+    def __init__(self, retry_after=0.0):
+        self.retry_after = retry_after
+
+    async def take_token(self, key, rate, burst):
+        await asyncio.sleep(0.01)
+        return self.retry_after
+
+
+def test_rate_limiter_cap_holds_while_backend_awaits(monkeypatch):
+    monkeypatch.setitem(server.ROUTE_CLASS_LIMITS, "search", (100, 100, 2))
+    limiter = server.RateLimiter(SlowBackend())
+
+    async def run():
+        return await asyncio.gather(*[limiter.acquire("user:a", "search") for _ in range(10)])
+
+    results = asyncio.run(run())
+    assert results.count(0) == 2
+    assert limiter.active == {"user:a:search": 2}
+
+
+def test_rate_limiter_gives_slot_back_when_rate_limited(monkeypatch):
+    monkeypatch.setitem(server.ROUTE_CLASS_LIMITS, "search", (100, 100, 2))
+    limiter = server.RateLimiter(SlowBackend(retry_after=0.5))
+    assert asyncio.run(limiter.acquire("user:a", "search")) == 0.5
+    assert limiter.active == {}
+
+
+def test_mongo_waiting_counter_is_thread_safe():
+    monitor = server.LoadMonitor()
+    listener = server.make_pool_listener(monitor)
+
+    def check_outs():
+        for _ in range(10000):
+            listener.connection_check_out_started(None)
+            listener.connection_checked_out(None)
+
+    threads = [threading.Thread(target=check_outs) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert monitor.mongo_waiting == 0